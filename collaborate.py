@@ -9,7 +9,7 @@ from neurowriter.writer import Writer
 from neurowriter.encoding import END
 
 
-def collaborate(modelname, encodername, creativity):
+def collaborate(modelname, encodername, creativity, topk=50):
     """Generates infinite text using human input and a pre-trained model"""
     # Load pre-trained encoder
     encoder = loadencoding(encodername)
@@ -19,7 +19,7 @@ def collaborate(modelname, encodername, creativity):
 
     # Text generation loop
     writer = Writer(model, encoder, creativity=creativity, batchsize=1,
-                    beamsize=1)
+                    beamsize=1, topk=topk)
     while True:
         collaborate_document(writer)
 
@@ -80,7 +80,11 @@ if __name__ == '__main__':
                         help='amount of creativity in the generation. '
                              'Default: 0.5',
                         default=0.5)
+    parser.add_argument('--topk', type=int,
+                        help='sample only among the k most probable tokens, '
+                             '0 to disable. Default: 50',
+                        default=50)
     args = parser.parse_args()
 
     collaborate(modelname=args.model, encodername=args.encoder,
-                creativity=args.creativity)
+                creativity=args.creativity, topk=args.topk)
@@ -11,7 +11,7 @@ from neurowriter.writer import Writer
 from neurowriter.encoding import END
 
 
-def generate(modelname, encodername, seed, creativity, maxtokens=None):
+def generate(modelname, encodername, seed, creativity, maxtokens=None, topk=50):
     """Generates infinite text using a pre-trained model and a seed text"""
     # Load pre-trained encoder
     encoder = loadencoding(encodername)
@@ -21,7 +21,7 @@ def generate(modelname, encodername, seed, creativity, maxtokens=None):
 
     # Text generation
     print("Seed:", seed)
-    writer = Writer(model, encoder, creativity=creativity, batchsize=1, beamsize=1)
+    writer = Writer(model, encoder, creativity=creativity, batchsize=1, beamsize=1, topk=topk)
     print("Generated:")
     print(seed, end='')
     for i, token in enumerate(writer.generate(seed)):
@@ -42,7 +42,10 @@ if __name__ == '__main__':
                         default=0.5)
     parser.add_argument('--maxtokens', type=int, help='maximum number of tokens to generate. Default: never stop',
                         default=None)
+    parser.add_argument('--topk', type=int, help='sample only among the k most probable tokens, 0 to disable. '
+                        'Default: 50',
+                        default=50)
     args = parser.parse_args()
 
     generate(modelname=args.model, encodername=args.encoder, seed=args.seed, creativity=args.creativity,
-             maxtokens=args.maxtokens)
+             maxtokens=args.maxtokens, topk=args.topk)
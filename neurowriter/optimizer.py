@@ -8,14 +8,14 @@ Module for optimizing model desing.
 @author: Álvaro Barbero Jiménez
 """
 
-from keras.callbacks import EarlyStopping, ModelCheckpoint
+from keras.callbacks import Callback, EarlyStopping
 from keras.optimizers import SGD, Adam, RMSprop, Nadam
 from keras.models import load_model
 from skopt import gbrt_minimize
 from skopt.plots import plot_convergence
 from keras import backend
-from tempfile import NamedTemporaryFile
 import pickle as pkl
+import math
 
 # Loss to account for failed hyperoptmimization trials
 FAILEDTRIALLOSS = 1000
@@ -45,8 +45,36 @@ def optimizerbyname(optname):
     return optimizers[normalized]
 
 
+class BestWeightsKeeper(Callback):
+    """Keras callback that keeps in memory the weights of the best model seen during training
+
+    Weights are snapshotted as host numpy arrays every time the monitored
+    loss improves, so they can be restored once training is over.
+    """
+    def __init__(self, monitor="val_loss"):
+        super().__init__()
+        self.monitor = monitor
+        self.best = float("inf")
+        self.best_weights = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is not None and current < self.best:
+            self.best = current
+            self.best_weights = self.model.get_weights()
+
+
+def validationepochs(maxepochs, patience, evalevery):
+    """Returns the list of epochs in which to run validation (1-based, as expected by Keras)
+
+    Validation is run every evalevery epochs, and always in the last patience epochs.
+    """
+    return [epoch for epoch in range(1, maxepochs + 1)
+            if epoch % evalevery == 0 or epoch > maxepochs - patience]
+
+
 def trainmodel(modelclass, inputtokens, encoder, corpus, maxepochs=1000, valmask=None, patience=10, batchsize=256,
-               optimizerclass=Adam, learningrate=None, verbose=1, modelparams=[]):
+               optimizerclass=Adam, learningrate=None, verbose=1, modelparams=[], evalevery=1):
     """Trains a keras model with given parameters
     
     Arguments
@@ -63,7 +91,20 @@ def trainmodel(modelclass, inputtokens, encoder, corpus, maxepochs=1000, valmask
         learningrate: learning rate to use in the optimizer
         verbose: verbosity level (0 to 2)
         modelparams: list of parameters to be passed to the modelkind function
+        evalevery: run validation only every this number of epochs. Validation
+            is always run in the last patience epochs. Early stopping patience
+            is still measured in epochs, so stopping is delayed by less than
+            evalevery epochs.
     """
+    if evalevery < 1:
+        raise ValueError("evalevery must be at least 1, got %s" % str(evalevery))
+    # Epochs in which to run validation, only if not validating every epoch
+    fitkwargs = {}
+    if evalevery > 1:
+        fitkwargs["validation_freq"] = validationepochs(maxepochs, patience, evalevery)
+    # Early stopping only counts validated epochs, so convert patience from epochs to validations
+    valpatience = max(1, math.ceil(patience / evalevery))
+
     if verbose >= 1:
         print("Training with inputtokens=%d, batchsize=%d, optimizer=%s, learningrate=%f, modelparams=%s" %
               (inputtokens, batchsize, str(optimizerclass), learningrate, str(modelparams)))
@@ -109,25 +150,26 @@ def trainmodel(modelclass, inputtokens, encoder, corpus, maxepochs=1000, valmask
         infinite=True
     )
 
+    # Prepare callbacks
+    bestweights = BestWeightsKeeper()
+    callbacks = [
+        EarlyStopping(patience=valpatience),
+        bestweights
+    ]
     # Model training
-    with NamedTemporaryFile() as modelfile:
-        # Prepare callbacks
-        callbacks = [
-            EarlyStopping(patience=patience),
-            ModelCheckpoint(modelfile.name, save_best_only=True, save_weights_only=True)
-        ]
-        # Train model
-        train_history = model.fit_generator(
-            traingenerator,
-            steps_per_epoch=ntrainbatches,
-            validation_data=valgenerator,
-            validation_steps=nvalbatches,
-            epochs=maxepochs,
-            verbose=2 if verbose == 2 else 0,
-            callbacks=callbacks
-        )
-        # Recover best model seen during training
-        model.load_weights(modelfile.name)
+    train_history = model.fit_generator(
+        traingenerator,
+        steps_per_epoch=ntrainbatches,
+        validation_data=valgenerator,
+        validation_steps=nvalbatches,
+        epochs=maxepochs,
+        verbose=2 if verbose == 2 else 0,
+        callbacks=callbacks,
+        **fitkwargs
+    )
+    # Recover best model seen during training
+    if bestweights.best_weights is not None:
+        model.set_weights(bestweights.best_weights)
 
     # Trim model to make it more efficent for predictions
     model = modelclass.trim(model)
@@ -152,7 +194,7 @@ def trainwrapper(modelclass, encoder, corpus, params, **kwargs):
 
 
 def createobjective(modelclass, encoder, corpus, verbose=1, valmask=None, patience=20, maxepochs=1000,
-                    modelsfolder=None, checkpointfile=None):
+                    modelsfolder=None, checkpointfile=None, evalevery=1):
     """Creates an objective function for the hyperoptimizer
     
     Arguments
@@ -164,6 +206,7 @@ def createobjective(modelclass, encoder, corpus, verbose=1, valmask=None, patien
         maxepochs: maximum allowed training epochs for each model
         modelsfolder: folder in which to save all tested models
         checkpointfile: file in which to save hyperoptimizer trials
+        evalevery: run validation only every this number of epochs
         
     Returns an objective function that given model parameters traings a full
     network over a corpus, and returns the validation loss over such corpus.
@@ -179,7 +222,8 @@ def createobjective(modelclass, encoder, corpus, verbose=1, valmask=None, patien
                 verbose=verbose,
                 valmask=valmask,
                 patience=patience,
-                maxepochs=maxepochs
+                maxepochs=maxepochs,
+                evalevery=evalevery
             )
             # Extract validation loss
             bestloss = min(train_history.history['val_loss'])
@@ -212,7 +256,7 @@ def loss2modelname(loss):
 
 
 def findbestparams(modelclass, encoder, corpus, modelsfolder, n_calls=100, verbose=1, valmask=None, patience=20,
-                   maxepochs=1000, checkpointfile=None):
+                   maxepochs=1000, checkpointfile=None, evalevery=1):
     """Find the best parameters for a given model architecture and param grid
     
     Returns
@@ -239,7 +283,8 @@ def findbestparams(modelclass, encoder, corpus, modelsfolder, n_calls=100, verbo
         print("Checkpoint y0", y0)
     # Prepare and run optimizer
     fobj = createobjective(modelclass, encoder, corpus, verbose=verbose, valmask=valmask, patience=patience,
-                           maxepochs=maxepochs, modelsfolder=modelsfolder, checkpointfile=checkpointfile)
+                           maxepochs=maxepochs, modelsfolder=modelsfolder, checkpointfile=checkpointfile,
+                           evalevery=evalevery)
     grid = addoptimizerparams(modelclass.paramgrid)
     trials = max(n_calls - previoustrials, 1)  # Run remaining trials, minimum 10
     randomtrials = max(RANDOMTRIALS - previoustrials, 0)
@@ -299,7 +344,7 @@ def checkpointload(checkpointfile):
 
 
 def hypertrain(modelclass, encoder, corpus, modelsfolder, n_calls=100, verbose=1, valmask=None, patience=20,
-               maxepochs=1000, checkpointfile=None):
+               maxepochs=1000, checkpointfile=None, evalevery=1):
     """Performs hypertraining of a certain model architecture
 
     Arguments
@@ -314,6 +359,8 @@ def hypertrain(modelclass, encoder, corpus, modelsfolder, n_calls=100, verbose=1
         - maxepochs: maximum allowed training epochs for each model
         - checkpointfile: name of the file to use for checkpointing the hyperoptimization progress. If the file
             already exists, its contents are used to warm-start the hyperoptimization
+        - evalevery: run validation only every this number of epochs, and always in the last patience epochs.
+            Patience is still measured in epochs.
 
     Returns 
         - The trained model with the best parameters
@@ -329,7 +376,8 @@ def hypertrain(modelclass, encoder, corpus, modelsfolder, n_calls=100, verbose=1
         valmask=valmask,
         patience=patience,
         maxepochs=maxepochs,
-        checkpointfile=checkpointfile
+        checkpointfile=checkpointfile,
+        evalevery=evalevery
     )
     if verbose >= 1:
         print("Best parameters are", bestparams)
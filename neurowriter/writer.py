@@ -11,7 +11,7 @@ import itertools
 from neurowriter.symbols import NULL, START, END
 
 class Writer():      
-    def __init__(self, model, encoder, creativity=0, beamsize=5, batchsize=3):
+    def __init__(self, model, encoder, creativity=0, beamsize=5, batchsize=3, topk=50):
         """Creates a writer using a pretrained model
         
         Arguments:
@@ -20,12 +20,15 @@ class Writer():
             creativity: creativity rate (probability temperature
             beamsize: size of beam search
             batchsize: number of tokens generated at the same time in beam search
+            topk: when using creativity, sample only among the topk most probable
+                candidates. Use None or 0 to sample among all candidates.
         """
         self.model = model
         self.encoder = encoder
         self.creativity = creativity
         self.beamsize = beamsize
         self.batchsize = batchsize
+        self.topk = topk
         
     def write(self, seed="", length=1000):
         """Start writing characters
@@ -82,60 +85,69 @@ class Writer():
         # Store original length of seed
         maxlen = len(seedcoded)
         # Predict first token probabilities
-        probs = self.model.predict(np.array([seedcoded]), verbose=0)[0]
-        # Initiate candidates for beam search
-        newcandidates = [(np.log(p), [i]) for i, p in enumerate(probs)]
-        # Select candidates for beam search
-        candidates = self.drawcandidates(newcandidates, self.beamsize)
+        probs = self.model.predict_on_batch(np.array([seedcoded]))
+        # Select candidates for beam search, extending an empty sequence
+        candidates = self.drawcandidates(np.log(probs), [[]], self.beamsize)
         # Beam depth extension steps
         for _ in range(1, self.batchsize):
-            # Extend each candidate
-            newcandidates = []
-            for logprob, tokens in candidates:
-                # Update seed with candidate tokens
-                # Also drop tokens if longer than necessary
-                candseed = np.append(seedcoded[len(tokens):], tokens)[:maxlen]
-                # Predictions for next token
-                probs = self.model.predict(np.array([candseed]), verbose=0)[0]
-                # Add to pool of next round tokens
-                newcandidates.extend([
-                    (logprob + np.log(p), tokens + [idx])
-                    for idx, p in enumerate(probs)
-                ])
+            # Update seed with each candidate tokens
+            # Also drop tokens if longer than necessary
+            candseeds = np.array([
+                np.append(seedcoded[len(tokens):], tokens)[:maxlen]
+                for _, tokens in candidates
+            ])
+            # Predictions for next token of all candidates in a single batch
+            candprobs = self.model.predict_on_batch(candseeds)
+            # Log-probabilities of every candidate extended with every token
+            logprobs = np.array([logprob for logprob, _ in candidates])
+            extlogprobs = logprobs[:, np.newaxis] + np.log(candprobs)
             # Select candidates for next step
-            candidates = self.drawcandidates(newcandidates, self.beamsize)
+            candidates = self.drawcandidates(extlogprobs, [tokens for _, tokens in candidates], self.beamsize)
         # Return tokens of best candidate found
         return max(candidates, key=lambda x: x[0])[1]
     
-    def drawcandidates(self, candidates, n):
-        """Draws n candidates from a candidates list
+    def drawcandidates(self, logprobs, prefixes, n):
+        """Draws n candidates from a matrix of extension log-probabilities
+
+        Inputs:
+            logprobs: numpy matrix with one row per prefix and one column per
+                token, with the log-probability of extending that prefix with that token
+            prefixes: list of token sequences being extended
+            n: number of candidates to draw
         
         If no creativity has been configured, just draw the best candidates.
         If creativy has been configured, draw with random sampling according
-        to the probability of each candidate.
+        to the probability of each candidate, restricted to the topk most
+        probable candidates.
+
+        Returns a list of candidates as (logprob, tokens) tuples.
         """
+        flatlogprobs = np.ravel(logprobs)
         # No creativity: take the top with highest probability
         if self.creativity == 0:
-            return topk(candidates, self.beamsize, key=lambda x: x[0])
+            idx = np.argsort(-flatlogprobs, kind="stable")[:n]
         # Creativity: random sampling
         else:
-            probs = np.array([prob for prob, tokens in candidates])
-            return [candidates[sample(probs, self.creativity)] for _ in range(n)]
+            # Restrict the sampling pool to the topk candidates, if requested
+            if self.topk is not None and 0 < self.topk < len(flatlogprobs):
+                pool = np.argpartition(-flatlogprobs, self.topk - 1)[:self.topk]
+            else:
+                pool = np.arange(len(flatlogprobs))
+            poollogprobs = flatlogprobs[pool]
+            idx = [pool[sample(poollogprobs, self.creativity)] for _ in range(n)]
+        # Only build token lists for the drawn candidates
+        ntokens = logprobs.shape[-1]
+        return [
+            (flatlogprobs[i], prefixes[i // ntokens] + [int(i % ntokens)])
+            for i in idx
+        ]
             
-def normalize(probs):
-    """Normalizes a list of probabilities, so that they sum up to 1"""
-    prob_factor = 1 / sum(probs)
-    return [prob_factor * p for p in probs]
-    
 def sample(logprobs, temperature=1.0):
-    """Modifies probabilities with a given temperature, to add creativity""" 
-    probs = np.exp(logprobs / temperature)
-    normprobs = normalize(probs)
-    return np.argmax(np.random.multinomial(1, normprobs, 1))
+    """Modifies probabilities with a given temperature, to add creativity
 
-def topk(l, k, key=lambda x: x):
-    """Returns a sublist with the top k elements from a givenlist. Accepts key"""
-    idx, _ = zip(*sorted(enumerate(l), key = lambda x: key(x[1]), 
-                         reverse=True))
-    return [l[i] for i in idx[0:k]]
-    
\ No newline at end of file
+    Uses the Gumbel-max trick: the argmax of the tempered log-probabilities
+    plus Gumbel noise follows the same distribution as sampling from their
+    normalized softmax, without having to compute it.
+    """
+    noise = np.random.gumbel(size=len(logprobs))
+    return np.argmax(logprobs / temperature + noise)
@@ -6,12 +6,14 @@ Tests for the optimizer module.
 @author: Álvaro Barbero Jiménez
 """
 
-from neurowriter.optimizer import chekpointappend, checkpointload, hypertrain
+from neurowriter.optimizer import chekpointappend, checkpointload, hypertrain, BestWeightsKeeper
+from neurowriter.optimizer import trainmodel, validationepochs
 from neurowriter.models import PerceptronModel, SmallWavenet
 from neurowriter.corpus import Corpus
 from neurowriter.encoding import Encoder
 from neurowriter.tokenizer import CharTokenizer
 from tempfile import NamedTemporaryFile, mkdtemp
+from keras.callbacks import EarlyStopping
 from shutil import copyfile, rmtree
 
 DATAFOLDER = "tests/data/"
@@ -40,6 +42,105 @@ def test_checkpoint():
         assert(y0 == losses)
 
 
+class MockWeightsModel():
+    """Mock model whose weights are just the epoch number"""
+    def __init__(self):
+        self.epoch = 0
+
+    def get_weights(self):
+        return [self.epoch]
+
+
+def test_bestweightskeeper():
+    """The weights of the epoch with the best validation loss are kept"""
+    model = MockWeightsModel()
+    keeper = BestWeightsKeeper()
+    keeper.set_model(model)
+    for epoch, loss in enumerate([3.0, 2.0, 2.5, 1.5, 1.7]):
+        model.epoch = epoch
+        keeper.on_epoch_end(epoch, {"val_loss": loss})
+
+    assert keeper.best == 1.5
+    assert keeper.best_weights == [3]
+
+
+def test_validationepochs():
+    """Validation epochs are every evalevery epochs plus the last patience epochs"""
+    tests = [
+        ((10, 2, 1), list(range(1, 11))),
+        ((10, 2, 3), [3, 6, 9, 10]),
+        ((10, 3, 4), [4, 8, 9, 10]),
+        ((5, 5, 2), [1, 2, 3, 4, 5]),
+        ((5, 8, 3), [1, 2, 3, 4, 5]),
+    ]
+    for args, expected in tests:
+        obtained = validationepochs(*args)
+        print("Expected", expected)
+        print("Obtained", obtained)
+        assert obtained == expected
+
+
+class MockHistory():
+    """Mock of a keras training history"""
+    history = {}
+
+
+class MockFitModel():
+    """Mock keras model that records the arguments used for training"""
+    def compile(self, **kwargs):
+        pass
+
+    def fit_generator(self, generator, **kwargs):
+        self.fitkwargs = kwargs
+        return MockHistory()
+
+
+class MockModelClass():
+    """Mock model class creating MockFitModel instances"""
+    @staticmethod
+    def create(*args):
+        return MockFitModel()
+
+    @staticmethod
+    def trim(model):
+        return model
+
+
+def test_trainmodel_evalevery():
+    """Validation frequency and early stopping patience are configured from evalevery"""
+    corpus = Corpus(["This is a very small corpus for testing the training procedure.", "Hope it works!!!"])
+    encoder = Encoder(corpus, CharTokenizer)
+    tests = [
+        # evalevery, patience, expected validation_freq, expected early stopping patience
+        (1, 4, None, 4),
+        (2, 4, [2, 4, 6, 7, 8, 9, 10], 2),
+        (3, 4, [3, 6, 7, 8, 9, 10], 2),
+        (5, 2, [5, 9, 10], 1),
+    ]
+    for evalevery, patience, expectedfreq, expectedpatience in tests:
+        model, _ = trainmodel(MockModelClass, 4, encoder, corpus, maxepochs=10, patience=patience, batchsize=8,
+                              learningrate=1e-3, verbose=0, evalevery=evalevery)
+        obtainedfreq = model.fitkwargs.get("validation_freq")
+        earlystopping = [c for c in model.fitkwargs["callbacks"] if isinstance(c, EarlyStopping)][0]
+        print("Expected", expectedfreq, expectedpatience)
+        print("Obtained", obtainedfreq, earlystopping.patience)
+        assert obtainedfreq == expectedfreq
+        assert earlystopping.patience == expectedpatience
+
+
+def test_trainmodel_evalevery_invalid():
+    """Validation frequencies below 1 are rejected"""
+    corpus = Corpus(["This is a very small corpus for testing the training procedure.", "Hope it works!!!"])
+    encoder = Encoder(corpus, CharTokenizer)
+    for evalevery in [0, -1]:
+        try:
+            trainmodel(MockModelClass, 4, encoder, corpus, maxepochs=10, learningrate=1e-3, verbose=0,
+                       evalevery=evalevery)
+            assert False, "ValueError not raised for evalevery=%d" % evalevery
+        except ValueError:
+            pass
+
+
 def test_hypertrain_run():
     """A small hypertraining procedure can be run"""
     modelclass = PerceptronModel
@@ -10,7 +10,7 @@ Tests for the Writer module
 
 import numpy as np
 
-from neurowriter.writer import Writer
+from neurowriter.writer import Writer, sample
 from neurowriter.encoding import Encoder
 from neurowriter.tokenizer import CharTokenizer
 from neurowriter.corpus import Corpus
@@ -18,8 +18,8 @@ from neurowriter.corpus import Corpus
 
 class MockModel():
     """Mock model for beam search tests"""
-    def predict(self, X, **kwargs):
-        return [[0.5, 0.3, 0.2]]
+    def predict_on_batch(self, X):
+        return np.tile([0.5, 0.3, 0.2], (len(X), 1))
 
 
 def test_writer_beamsearch():
@@ -51,3 +51,69 @@ def test_writer_beamsearch_long():
     print("Expected", expected)
     print("Obtained", obtained)
     assert obtained == expected
+
+
+def test_writer_beamsearch_topk():
+    """Creative beam search with topk=1 always draws the most probable tokens"""
+    mockmodel = MockModel()
+    corpus = Corpus(["abc"])
+    encoder = Encoder(corpus=corpus, tokenizer=CharTokenizer())
+    batchsize = 5
+    writer = Writer(mockmodel, encoder, creativity=1.0, beamsize=3,
+                    batchsize=batchsize, topk=1)
+    seed = np.array([0, 0])
+    expected = [0] * batchsize
+    obtained = writer.beamsearch(seed)
+    print("Expected", expected)
+    print("Obtained", obtained)
+    assert obtained == expected
+
+
+def test_writer_drawcandidates_topk_disabled():
+    """Creative sampling with None or non-positive topk draws among all candidates"""
+    np.random.seed(0)
+    corpus = Corpus(["abc"])
+    encoder = Encoder(corpus=corpus, tokenizer=CharTokenizer())
+    logprobs = np.log([[0.5, 0.3, 0.2]])
+    for topk in [None, 0, -1]:
+        writer = Writer(MockModel(), encoder, creativity=1.0, topk=topk)
+        candidates = writer.drawcandidates(logprobs, [[]], 200)
+        drawn = set(tokens[0] for _, tokens in candidates)
+        print("topk", topk, "drawn", drawn)
+        assert drawn == {0, 1, 2}
+
+
+class CountingMockModel(MockModel):
+    """Mock model that records the number of predictions calls"""
+    def __init__(self):
+        self.calls = 0
+
+    def predict_on_batch(self, X):
+        self.calls += 1
+        return super().predict_on_batch(X)
+
+
+def test_writer_beamsearch_batched():
+    """Beam search extends all candidates with a single model call per step"""
+    mockmodel = CountingMockModel()
+    corpus = Corpus(["abc"])
+    encoder = Encoder(corpus=corpus, tokenizer=CharTokenizer())
+    batchsize = 4
+    writer = Writer(mockmodel, encoder, creativity=0, beamsize=3,
+                    batchsize=batchsize)
+    seed = np.array([0, 0])
+    writer.beamsearch(seed)
+    print("Model calls", mockmodel.calls)
+    assert mockmodel.calls == batchsize
+
+
+def test_sample_frequencies():
+    """Sampled frequencies match the given probabilities"""
+    np.random.seed(0)
+    probs = np.array([0.5, 0.3, 0.2])
+    ndraws = 20000
+    draws = [sample(np.log(probs), 1.0) for _ in range(ndraws)]
+    obtained = np.bincount(draws, minlength=len(probs)) / ndraws
+    print("Expected", probs)
+    print("Obtained", obtained)
+    assert np.allclose(obtained, probs, atol=0.02)
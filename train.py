@@ -11,7 +11,7 @@ from neurowriter.optimizer import hypertrain
 
 
 def train(corpus, corpusformat, encoderfile, modelfile, architecture, tokenizer, trials, tmpmodels, checkpoint,
-          maxepochs):
+          maxepochs, evalevery=1):
     """Trains a Neurowriter model"""
     # Load corpus
     corpus = FORMATTERSBYNAME[corpusformat](corpus)
@@ -35,7 +35,8 @@ def train(corpus, corpusformat, encoderfile, modelfile, architecture, tokenizer,
     modelclass = modelbyname(architecture)
 
     model = hypertrain(modelclass, encoder, corpus, tmpmodels, n_calls=trials, verbose=2,
-                       valmask=[False]*3+[True], checkpointfile=checkpoint, maxepochs=maxepochs)
+                       valmask=[False]*3+[True], checkpointfile=checkpoint, maxepochs=maxepochs,
+                       evalevery=evalevery)
     model.save(modelfile)
 
 if __name__ == "__main__":
@@ -51,7 +52,10 @@ if __name__ == "__main__":
     parser.add_argument("--tmpmodels", type=str, default=None, help="Directory where to save intermediate models")
     parser.add_argument("--checkpoint", type=str, default=None, help="Hyperoptimization checkpoint file")
     parser.add_argument("--maxepochs", type=int, default=1000, help="Maximum epochs to run per model trial")
+    parser.add_argument("--evalevery", type=int, default=1,
+                        help="Run validation only every this number of epochs (always in the last patience epochs). "
+                             "Early stopping patience is still measured in epochs")
     args = parser.parse_args()
 
     train(args.corpus, args.corpusformat, args.encoder, args.model, args.architecture, args.tokenizer, args.trials,
-          args.tmpmodels, args.checkpoint, args.maxepochs)
+          args.tmpmodels, args.checkpoint, args.maxepochs, args.evalevery)